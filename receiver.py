@@ -1,35 +1,75 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from typing import Callable, Final
+from fastapi import BackgroundTasks, FastAPI, Request, HTTPException
+from fastapi.responses import ORJSONResponse
+from aiolimiter import AsyncLimiter
+import asyncio
+import hmac
+import logging
 import os
-import json
-import requests
+import time
+import httpx
+import msgspec
 
-app = FastAPI()
+DEBUG = os.environ.get('DEBUG', '').lower() in ('1', 'true', 'yes')
+
+# uvicorn worker processes, used to split process-wide budgets such as the
+# GitHub rate limit. Only an explicit WEB_CONCURRENCY counts; anything else
+# is treated as a single process.
+WORKERS = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+
+logging.basicConfig(level=logging.DEBUG if DEBUG else logging.WARNING)
+logger = logging.getLogger(__name__)
 
 # GitHub API configuration
 GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')
 GITHUB_API_URL = "https://api.github.com"
 
+# Expected Authorization header, built once at startup
+API_TOKEN = os.environ.get('API_TOKEN')
+_EXPECTED_AUTH = f"Bearer {API_TOKEN}".encode() if API_TOKEN else None
+
+# Shared GitHub client: pooled keep-alive connections over HTTP/2, so each
+# comment reuses an open TLS connection instead of doing a fresh handshake
+GITHUB_CLIENT = httpx.AsyncClient(
+    base_url=GITHUB_API_URL,
+    http2=True,
+    timeout=30,
+    headers={
+        "Accept": "application/vnd.github+json",
+        "User-Agent": "Semgrep-Architecture-Bot",
+        "Authorization": f"token {GITHUB_TOKEN}"
+    }
+)
+
+# GitHub allows 80 content-creating requests per minute and 500 per hour;
+# stay below both and retry a bounded number of times when throttled.
+# The limiters live in each worker, so the budget is shared out between them.
+GITHUB_LIMITER = AsyncLimiter(max(1, 70 // WORKERS), 60)
+GITHUB_HOURLY_LIMITER = AsyncLimiter(max(1, 450 // WORKERS), 3600)
+GITHUB_MAX_ATTEMPTS = 3
+GITHUB_MAX_RETRY_DELAY = 60
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await GITHUB_CLIENT.aclose()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
 @app.post('/receiver')
-async def receive_semgrep(request: Request):
-    print("Request received at /receiver")
-    
-    # Log all incoming headers for debugging (excluding sensitive ones)
-    print("Incoming headers:")
-    for header, value in request.headers.items():
-        if header.lower() not in ['authorization', 'x-github-token']:  # Hide sensitive info
-            print(f"  {header}: {value}")
+async def receive_semgrep(request: Request, background: BackgroundTasks):
+    logger.debug("Request received at /receiver")
     
     # Authentication check
-    auth_header = request.headers.get('Authorization')
-    expected_auth = f"Bearer {os.environ.get('API_TOKEN')}"
-    if auth_header != expected_auth:
-        print(f"❌ Authentication failed (expected: {expected_auth}, received: {auth_header})")
+    auth_header = request.headers.get('Authorization', '').encode()
+    if _EXPECTED_AUTH is None or not hmac.compare_digest(auth_header, _EXPECTED_AUTH):
+        logger.warning("❌ Authentication failed")
         raise HTTPException(status_code=401, detail='Unauthorized')
     
     try:
-        semgrep_data = await request.json()
-        print('Received Semgrep results:', json.dumps(semgrep_data, indent=2))
+        payload = msgspec.json.decode(await request.body(), type=SemgrepPayload)
+        logger.debug("Received Semgrep results: %d issues", len(payload.results or ()))
         
         # Extract GitHub context from headers
         github_context = {
@@ -38,125 +78,194 @@ async def receive_semgrep(request: Request):
             'pr_number': request.headers.get('X-GitHub-PR-Number')
         }
         
-        print(f"Extracted GitHub context: {github_context}")
-        print(f"GITHUB_TOKEN present: {'Yes' if GITHUB_TOKEN else 'No'}")
+        logger.debug("Extracted GitHub context: %s", github_context)
+        logger.debug("GITHUB_TOKEN present: %s", 'Yes' if GITHUB_TOKEN else 'No')
         
         # Check if we have all required data
         if all(github_context.values()) and GITHUB_TOKEN:
-            print("✅ All required data present - generating summary and posting comment")
-            summary = create_summary(semgrep_data)
-            success = post_github_comment(github_context, summary)
-            
-            if success:
-                print(f"✅ Successfully posted comment to PR #{github_context['pr_number']}")
-            else:
-                print("❌ Failed to post GitHub comment")
+            logger.debug("✅ All required data present - generating summary and posting comment")
+            summary = create_summary(payload)
+            # Posted after the response is sent; post_github_comment logs its own outcome
+            background.add_task(post_github_comment, github_context, summary)
         else:
-            print("⚠️ Skipping comment posting - missing GitHub context or token")
+            logger.warning("⚠️ Skipping comment posting - missing GitHub context or token")
         
-        return JSONResponse(content={'status': 'success', 'message': 'Results received and processed'})
+        return {'status': 'success', 'message': 'Results received and processed'}
     
     except Exception as e:
-        print(f"❌ Error processing request: {str(e)}")
+        logger.error("❌ Error processing request: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
-def create_summary(semgrep_data):
+# Fields are optional so a malformed result is skipped or rendered with
+# defaults instead of rejecting the whole webhook
+class SemgrepExtra(msgspec.Struct):
+    message: str | None = None
+
+class SemgrepResult(msgspec.Struct):
+    check_id: str | None = None
+    path: str | None = None
+    extra: SemgrepExtra | None = None
+
+class SemgrepPayload(msgspec.Struct):
+    """Semgrep JSON output, reduced to the fields the summary uses.
+
+    Fields that are not declared here (code snippets, metadata, fixes, ...)
+    are skipped while decoding and never become Python objects.
+    """
+    results: list[SemgrepResult] | None = None
+
+_NO_ISSUES_MD: Final[str] = "✅ **Semgrep Architecture Scan Complete**\n\nNo issues found! Your code follows the defined architectural rules."
+_SCAN_HEADER_MD: Final[str] = "🏗️ **Angular Architecture Scan Results**\n\n"
+
+_RECOMMENDED_ACTIONS_MD: Final[str] = (
+    "### 🔧 **Recommended Actions**\n\n"
+    "**Immediate Steps:**\n"
+    "1. **Move `app.component.ts`** to `src/app/` (root level)\n"
+    "2. **Move layout components** to `src/app/shared/layout/` or `src/app/layout/`\n"
+    "3. **Keep `_core/` directory for:**\n"
+    "   - Services (auth, api, http, etc.)\n"
+    "   - Guards and interceptors\n"
+    "   - Utilities and helpers\n"
+    "   - Models and interfaces\n\n"
+)
+
+_BEST_PRACTICE_MD: Final[str] = "**Suggested File Structure:**\n``````\n\n"
+
+_WHY_MATTERS_MD: Final[str] = (
+    "**Why This Matters:**\n"
+    "- 🎯 **Clear separation of concerns** - components vs services\n"
+    "- 🔧 **Better maintainability** - easier to find and modify code\n"
+    "- 📚 **Angular best practices** - follows official style guide\n"
+    "- 👥 **Team collaboration** - consistent structure for all developers\n"
+)
+
+_FOOTER_MD: Final[str] = (
+    "\n---\n\n"
+    "⚡ **Action Required:** Please address these architecture violations before merging to maintain code quality standards.\n\n"
+    "*This comment was generated automatically by your Semgrep architecture scanner.*"
+)
+
+def _render_components_in_core(rule_id, rule_results, append):
+    """Render the no-components-in-core section"""
+    append("## 🚨 Critical Architecture Violation\n\n")
+    append(f"**Rule:** `{rule_id}`\n")
+    
+    # Get the message from the first result
+    extra = rule_results[0].extra
+    message = (extra and extra.message) or 'Architecture violation detected'
+    append(f"**Issue:** {message}\n\n")
+    
+    append(f"**Components Found in _core/ Directory ({len(rule_results)}):**\n")
+    
+    for issue in rule_results:
+        file_path = issue.path or 'Unknown file'
+        # Clean up the path for better readability
+        clean_path = file_path.removeprefix('property-mangement/')
+        append(f"- `{clean_path}`\n")
+    
+    append("\n")
+    
+    # Add specific guidance
+    append(_RECOMMENDED_ACTIONS_MD)
+    append(_BEST_PRACTICE_MD)
+    append(_WHY_MATTERS_MD)
+
+# Rules rendered in detail, keyed by rule ID. Results for any other rule are
+# only counted towards the total.
+RULE_RENDERERS: dict[str, Callable] = {
+    'no-components-in-core': _render_components_in_core
+}
+
+def create_summary(payload: SemgrepPayload):
     """Create a summary based on your actual Semgrep data structure"""
-    results = semgrep_data.get('results', [])
+    results = payload.results
     
     if not results:
-        return "✅ **Semgrep Architecture Scan Complete**\n\nNo issues found! Your code follows the defined architectural rules."
+        return _NO_ISSUES_MD
     
-    # Group by rule ID
+    # Group by rule ID, keeping only rules that have a renderer
     issues_by_rule = {}
+    get_bucket = issues_by_rule.get
     for result in results:
-        rule_id = result.get('check_id', 'unknown')
-        if rule_id not in issues_by_rule:
-            issues_by_rule[rule_id] = []
-        issues_by_rule[rule_id].append(result)
+        rule_id = result.check_id
+        if rule_id not in RULE_RENDERERS:
+            continue
+        bucket = get_bucket(rule_id)
+        if bucket is None:
+            bucket = issues_by_rule[rule_id] = []
+        bucket.append(result)
     
     # Build summary
-    summary = "🏗️ **Angular Architecture Scan Results**\n\n"
-    summary += f"**Total Issues Found:** {len(results)}\n\n"
+    parts = [_SCAN_HEADER_MD, f"**Total Issues Found:** {len(results)}\n\n"]
+    append = parts.append
     
-    # Process each rule
     for rule_id, rule_results in issues_by_rule.items():
-        if rule_id == 'no-components-in-core':
-            summary += "## 🚨 Critical Architecture Violation\n\n"
-            summary += f"**Rule:** `{rule_id}`\n"
-            
-            # Get the message from the first result
-            first_result = rule_results[0]
-            message = first_result.get('extra', {}).get('message', 'Architecture violation detected')
-            # Clean up unicode characters
-            message = message.replace('\u274c', '❌')
-            summary += f"**Issue:** {message}\n\n"
-            
-            summary += f"**Components Found in _core/ Directory ({len(rule_results)}):**\n"
-            
-            for issue in rule_results:
-                file_path = issue.get('path', 'Unknown file')
-                # Clean up the path for better readability
-                clean_path = file_path.replace('property-mangement/', '')
-                summary += f"- `{clean_path}`\n"
-            
-            summary += "\n"
-            
-            # Add specific guidance
-            summary += "### 🔧 **Recommended Actions**\n\n"
-            summary += "**Immediate Steps:**\n"
-            summary += "1. **Move `app.component.ts`** to `src/app/` (root level)\n"
-            summary += "2. **Move layout components** to `src/app/shared/layout/` or `src/app/layout/`\n"
-            summary += "3. **Keep `_core/` directory for:**\n"
-            summary += "   - Services (auth, api, http, etc.)\n"
-            summary += "   - Guards and interceptors\n"
-            summary += "   - Utilities and helpers\n"
-            summary += "   - Models and interfaces\n\n"
-            
-            summary += "**Suggested File Structure:**\n``````\n\n"
-            
-            summary += "**Why This Matters:**\n"
-            summary += "- 🎯 **Clear separation of concerns** - components vs services\n"
-            summary += "- 🔧 **Better maintainability** - easier to find and modify code\n"
-            summary += "- 📚 **Angular best practices** - follows official style guide\n"
-            summary += "- 👥 **Team collaboration** - consistent structure for all developers\n"
+        RULE_RENDERERS[rule_id](rule_id, rule_results, append)
     
-    summary += "\n---\n\n"
-    summary += "⚡ **Action Required:** Please address these architecture violations before merging to maintain code quality standards.\n\n"
-    summary += "*This comment was generated automatically by your Semgrep architecture scanner.*"
+    append(_FOOTER_MD)
     
-    return summary
+    return "".join(parts)
 
-def post_github_comment(github_context, summary):
+async def post_github_comment(github_context, summary):
     """Post summary as GitHub PR comment"""
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json",
-        "User-Agent": "Semgrep-Architecture-Bot"
-    }
-    
-    comment_url = f"{GITHUB_API_URL}/repos/{github_context['owner']}/{github_context['repo']}/issues/{github_context['pr_number']}/comments"
+    comment_url = f"/repos/{github_context['owner']}/{github_context['repo']}/issues/{github_context['pr_number']}/comments"
     
     comment_data = {
         "body": summary
     }
     
     try:
-        print(f"Attempting to post comment to: {comment_url}")
-        response = requests.post(comment_url, json=comment_data, headers=headers, timeout=30)
+        logger.debug("Attempting to post comment to: %s", comment_url)
+        for attempt in range(1, GITHUB_MAX_ATTEMPTS + 1):
+            async with GITHUB_HOURLY_LIMITER, GITHUB_LIMITER:
+                response = await GITHUB_CLIENT.post(comment_url, json=comment_data)
+            
+            delay = rate_limit_delay(response)
+            if delay is None or attempt == GITHUB_MAX_ATTEMPTS:
+                break
+            if delay > GITHUB_MAX_RETRY_DELAY:
+                logger.error("❌ GitHub rate limit resets in %.0fs, not retrying", delay)
+                break
+            logger.warning("⚠️ GitHub rate limit hit, retrying in %.0fs", delay)
+            await asyncio.sleep(delay)
         
         if response.status_code == 201:
-            print("✅ Comment posted successfully!")
-            return True
+            logger.info("✅ Successfully posted comment to PR #%s", github_context['pr_number'])
         else:
-            print(f"❌ Failed to post comment. Status code: {response.status_code}")
-            print(f"GitHub API response: {response.text}")
-            return False
+            logger.error("❌ Failed to post comment. Status code: %s", response.status_code)
+            logger.error("GitHub API response: %s", response.text)
             
     except Exception as e:
-        print(f"❌ Error posting to GitHub: {str(e)}")
-        return False
+        logger.error("❌ Error posting to GitHub: %s", e)
+
+def rate_limit_delay(response):
+    """Return seconds to wait before retrying a rate-limited response, or None"""
+    if response.status_code not in (403, 429):
+        return None
+    
+    try:
+        retry_after = response.headers.get('retry-after')
+        if retry_after is not None:
+            # Only the delay-seconds form is supported; an HTTP date means no retry
+            return max(0, float(retry_after))
+        
+        if response.headers.get('x-ratelimit-remaining') == '0':
+            reset = int(response.headers['x-ratelimit-reset'])
+            return max(0, reset - time.time())
+    except (KeyError, ValueError):
+        pass
+    
+    return None
 
 if __name__ == '__main__':
     import uvicorn
-    uvicorn.run(app, host='0.0.0.0', port=8000)
+    # Export the worker count so each worker process sizes its limiters for it
+    os.environ.setdefault('WEB_CONCURRENCY', str((os.cpu_count() or 2) * 2 + 1))
+    uvicorn.run(
+        'receiver:app',
+        host='0.0.0.0',
+        port=8000,
+        workers=int(os.environ['WEB_CONCURRENCY']),
+        log_level='warning',
+        access_log=False
+    )